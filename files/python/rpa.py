@@ -1,34 +1,25 @@
-import io, mmap, pickle, zlib
-
-class GzipIO(io.IOBase):
-    def __init__(self, file):
-        self.file = file
-        self.dc = zlib.decompressobj()
-        self.buffer = bytearray()
-
-    def readable(): return True
-    def seekable(): return False
-    def writable(): return False
-
-    def read(self, n=-1):
-        if n == -1:
-            return self.readall()
-        while n > len(self.buffer):
-            b_in = bytearray(4096)
-            count = self.file.readinto(b_in)
-            self.buffer += b_in
-
-            if count < 4096: # EOF
-                self.buffer += self.dc.flush()
-                break
-
-        out = self.buffer[:n]
-        del self.buffer[:n]
-        return out
-        pass
-
-    def readall(self):
-        pass
+import errno, mmap, os, pickle, sys, zlib
+from array import array
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # Python 2 without the futures backport
+    ThreadPoolExecutor = None
+
+# sendfile() into a regular file is only supported on Linux; elsewhere it
+# either does not exist or requires the destination to be a socket.
+SENDFILE = hasattr(os, 'sendfile') and sys.platform.startswith('linux')
+# Errors from filesystems that refuse it anyway (e.g. FUSE or vboxsf mounts).
+SENDFILE_ERRNOS = set(getattr(errno, e) for e in
+                      ('EINVAL', 'ENOSYS', 'ENOTSUP', 'EOPNOTSUPP')
+                      if hasattr(errno, e))
+
+def offset_array():
+    # Python 2's array module has no 64-bit 'q' type; use a list there.
+    try:
+        return array('q')
+    except ValueError:
+        return []
 
 # Index format is a dictionary mapping file names to data blocks.
 # Each block is specified as a 2- or 3-tuple of (offset, len, [start]).
@@ -44,63 +35,142 @@ class GzipIO(io.IOBase):
 class RPA(object):
     def __init__(self, fname):
         self.fname = fname
-        with open(fname, "rb") as f:
-            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
-        self._index = self.loadIndex()
-        self.files = self.buildFileSet()
+        self._sendfile = SENDFILE
+        self.fd = os.open(fname, os.O_RDONLY)
+        self.mm = mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ)
+        # Harmless when sendfile copies members without touching the mapping.
+        if hasattr(mmap, 'MADV_SEQUENTIAL'):  # Python 3.8+, POSIX only
+            self.mm.madvise(mmap.MADV_SEQUENTIAL)
+        try:
+            self._mv = memoryview(self.mm)
+        except TypeError:  # Python 2 mmap has no new-style buffer interface
+            self._mv = self.mm
+        self.files = self.loadIndex()
 
     def loadIndex(self):
-        self.mm.seek(0)
-        header = self.mm.readline()
+        # Fixed-size header: b"RPA-3.0 %016x %08x\n"
+        header = self.mm[:34]
         assert header.startswith(b"RPA-3.0 ")
-            
+
         idx_ofs = int(header[8:24], 16)
         idx_key = int(header[25:33], 16)
-        #with GzipIO(f) as gz:
-        #    idx = pickle.load(gz)
-        idx = pickle.loads(zlib.decompress(self.mm[idx_ofs:]))
-
-        for k, v in idx.items():
-            # Block is a list. Meaningful?
-            assert len(v) == 1
-            assert len(v[0]) in (2, 3)
-
-            if len(v[0]) == 2:  # No start
-                ofs, dlen = v[0]
-                v[0] = (ofs ^ idx_key, dlen ^ idx_key, '')
-            else:
-                ofs, dlen, start = v[0]
-                v[0] = (ofs ^ idx_key, dlen ^ idx_key, start)
-
-        return idx
-
-    def buildFileSet(self):
-        fileset = {}
-        for name, params in self._index.items():
-            assert len(params) == 1
-            ofs, dlen, start = params[0]
-            assert not start
-            fileset[name] = self.mm[ofs:ofs+dlen]
-        return fileset
-
-import os.path
-def mkdirp(path):
-    if len(path) == 0:
-        return
-    path = path.split('/')
-    d = ''
-
-    for i in range(len(path)):
-        d = os.path.join(d, path[i])
-        if not os.path.isdir(d):
-            os.mkdir(d)
+        idx = pickle.loads(zlib.decompress(self._mv[idx_ofs:]))
+
+        # Block is a list. Meaningful? Checked once here, not per entry below.
+        assert all(len(v) == 1 and (len(v[0]) == 2 or
+                                    (len(v[0]) == 3 and not v[0][2]))
+                   for v in idx.values())
+
+        # Decoded index is kept as parallel arrays: member i is _names[i],
+        # stored at _offs[i] with length _lens[i]; _pos maps names to i.
+        names = self._names = []
+        offs = self._offs = offset_array()
+        lens = self._lens = offset_array()
+        for name, v in idx.items():
+            names.append(name)
+            offs.append(v[0][0] ^ idx_key)
+            lens.append(v[0][1] ^ idx_key)
+        self._pos = dict(zip(names, range(len(names))))
+
+        mv = self._mv
+        return dict(zip(names, [mv[o:o+n] for o, n in zip(offs, lens)]))
+
+    def close(self):
+        if self.fd is None:
+            return
+        # Every view into the mmap has to be released before it can close.
+        if isinstance(self._mv, memoryview):
+            for view in self.files.values():
+                view.release()
+            self._mv.release()
+        try:
+            self.mm.close()
+        except BufferError:
+            pass  # Slices held elsewhere; the last one to go frees the mmap
+        os.close(self.fd)
+        self.fd = None
+
+    def __del__(self):
+        fd = getattr(self, 'fd', None)
+        if fd is None:
+            return
+        # Unlike close(), leave views still held elsewhere usable.
+        self.files = {}
+        try:
+            self.close()
+        except AttributeError:  # Half-initialized
+            os.close(fd)
+
+    def extract(self, name, path=None):
+        i = self._pos[name]
+        ofs, dlen = self._offs[i], self._lens[i]
+        if path is None:
+            path = name
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+        dst = os.open(path, flags, 0o644)
+        try:
+            use_sendfile = self._sendfile
+            if use_sendfile:
+                # Copy straight from the archive inside the kernel.
+                first = True
+                while dlen > 0:
+                    try:
+                        sent = os.sendfile(dst, self.fd, ofs, dlen)
+                    except OSError as e:
+                        if not first or e.errno not in SENDFILE_ERRNOS:
+                            raise
+                        # Write this and all later members instead.
+                        self._sendfile = use_sendfile = False
+                        break
+                    if sent == 0:
+                        raise IOError("Unexpected end of archive: %s" % name)
+                    first = False
+                    ofs += sent
+                    dlen -= sent
+            if not use_sendfile:
+                # Unbuffered writes straight from the view; loop on short writes.
+                data = self.files[name]
+                written = 0
+                while written < len(data):
+                    written += os.write(dst, data[written:])
+        finally:
+            os.close(dst)
 
 
 if __name__ == "__main__":
-    import sys
     rpa = RPA(sys.argv[1])
-    for file, contents in rpa.files.items():
-        # print("{0:10} {1}".format(len(contents), file))
-        mkdirp(os.path.dirname(file))
-        with open(file, 'wb') as f:
-            f.write(contents)
+
+    # Create all directories first so the writers never race on mkdir.
+    # Deepest first: once a directory exists its parents do too, so only leaf
+    # directories ever need to touch the filesystem.
+    made = {''}
+    for d in sorted({os.path.dirname(file) for file in rpa.files}, reverse=True):
+        if d in made:
+            continue
+        if not os.path.isdir(d):  # makedirs has no exist_ok on Python 2
+            os.makedirs(d)
+        while d and d not in made:
+            made.add(d)
+            d = os.path.dirname(d)
+
+    if ThreadPoolExecutor is None:
+        for file in rpa.files:
+            rpa.extract(file)
+    else:
+        # Names like d/f and d//f, or A.png and a.png on a case-insensitive
+        # filesystem, can refer to the same file. Each such group goes to one
+        # worker and is written in archive order, so the last member wins.
+        groups = {}
+        for file in rpa.files:
+            groups.setdefault(os.path.normpath(file).lower(), []).append(file)
+
+        def extract_group(members):
+            for file in members:
+                rpa.extract(file)
+
+        # os.cpu_count is missing on Python 2, even with the futures backport.
+        workers = min(32, (getattr(os, 'cpu_count', lambda: None)() or 1) * 4)
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            list(ex.map(extract_group, groups.values()))
+
+    rpa.close()
@@ -4,21 +4,34 @@ Extract Python tools from UnRen batch file and prepare them for embedding in Go.
 This script decodes the Base64-encoded rpatool and unrpyc from the batch file.
 """
 
-import base64
 import re
 import os
 import sys
 
+try:
+    # SIMD-accelerated decoder; falls back to the stdlib when not installed
+    from pybase64 import b64decode
+except ImportError:
+    from base64 import b64decode
+
+SET_RE = re.compile(rb'^(?:REM\s+)?set\s+(\w+)=(.*)$')
+NUM_RE = re.compile(r'\d+')
+
+def chunk_number(var_name: str) -> int:
+    """Return the chunk number embedded in a variable name (0 if none)."""
+    match = NUM_RE.search(var_name)
+    return int(match.group()) if match else 0
+
 def extract_vars_from_batch(batch_path: str) -> dict:
-    """Extract set VAR=VALUE pairs from batch file."""
+    """Extract set VAR=VALUE pairs from batch file (values as raw bytes)."""
     variables = {}
-    with open(batch_path, 'r', encoding='utf-8', errors='ignore') as f:
+    with open(batch_path, 'rb', buffering=128 * 1024) as f:
         for line in f:
             # Match: set varname=value or REM set varname=value
-            match = re.match(r'^(?:REM\s+)?set\s+(\w+)=(.*)$', line.strip())
+            match = SET_RE.match(line.strip())
             if match:
-                var_name = match.group(1)
-                var_value = match.group(2).rstrip('\r\n')
+                var_name = match.group(1).decode('ascii')
+                var_value = match.group(2).rstrip(b'\r\n')
                 variables[var_name] = var_value
     return variables
 
@@ -29,7 +42,7 @@ def decode_and_save(variables: dict, var_prefixes: list, output_path: str):
     for prefix in var_prefixes:
         # Find all vars with this prefix, sorted by number
         matching = [(k, v) for k, v in variables.items() if k.startswith(prefix)]
-        matching.sort(key=lambda x: int(re.search(r'\d+', x[0]).group()) if re.search(r'\d+', x[0]) else 0)
+        matching.sort(key=lambda x: chunk_number(x[0]))
         for k, v in matching:
             chunks.append(v)
     
@@ -38,9 +51,9 @@ def decode_and_save(variables: dict, var_prefixes: list, output_path: str):
         return False
     
     # Join and decode
-    b64_data = ''.join(chunks)
+    b64_data = b''.join(chunks)
     try:
-        decoded = base64.b64decode(b64_data)
+        decoded = b64decode(b64_data)
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         with open(output_path, 'wb') as f:
             f.write(decoded)
@@ -86,9 +99,9 @@ def main():
             py3_chunks.append((key, variables[key]))
     
     if py3_chunks:
-        b64_data = ''.join([v for k, v in py3_chunks])
+        b64_data = b''.join([v for k, v in py3_chunks])
         try:
-            decoded = base64.b64decode(b64_data)
+            decoded = b64decode(b64_data)
             output_path = os.path.join(python_dir, 'rpatool.py')
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
             with open(output_path, 'wb') as f:
@@ -101,7 +114,7 @@ def main():
     print("\n=== rpa.py (fallback extractor) ===")
     if 'rpatool20' in variables:
         try:
-            decoded = base64.b64decode(variables['rpatool20'])
+            decoded = b64decode(variables['rpatool20'])
             output_path = os.path.join(python_dir, 'rpa.py')
             with open(output_path, 'wb') as f:
                 f.write(decoded)
@@ -118,9 +131,9 @@ def main():
             cab_chunks.append((key, variables[key]))
     
     if cab_chunks:
-        b64_data = ''.join([v for k, v in cab_chunks])
+        b64_data = b''.join([v for k, v in cab_chunks])
         try:
-            decoded = base64.b64decode(b64_data)
+            decoded = b64decode(b64_data)
             output_path = os.path.join(python_dir, 'unrpyc_py3.cab')
             with open(output_path, 'wb') as f:
                 f.write(decoded)
@@ -137,9 +150,9 @@ def main():
             cab_chunks.append((key, variables[key]))
     
     if cab_chunks:
-        b64_data = ''.join([v for k, v in cab_chunks])
+        b64_data = b''.join([v for k, v in cab_chunks])
         try:
-            decoded = base64.b64decode(b64_data)
+            decoded = b64decode(b64_data)
             output_path = os.path.join(python_dir, 'unrpyc_py2.cab')
             with open(output_path, 'wb') as f:
                 f.write(decoded)